@@ -1,13 +1,42 @@
 import cv2
+import io
 import time
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from picamera2 import Picamera2
 
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+except ImportError:  # PyTurboJPEG is optional; Picamera2 encodes otherwise
+    TurboJPEG = None
+
+# Help text printed when the controller starts
+CONTROLS_HELP = "\n".join([
+    "",
+    "Dual Camera Controller Started",
+    "--------------------------------",
+    "Controls:",
+    "  1, 2      - Select Camera 1 or 2",
+    "  s         - Save image from active camera",
+    "  d         - Save images from both cameras",
+    "  r         - Change resolution",
+    "  e/c       - Increase/decrease exposure of active camera",
+    "  b/v       - Increase/decrease brightness of active camera",
+    "  p         - Pause/resume preview",
+    "  q         - Quit application",
+    "--------------------------------",
+])
+
 class DualCameraController:
+    _BORDER_COLOR = np.array([0, 255, 0], np.uint8)  # BGR green for the active camera
+    
     def __init__(self):
         # Initialize variables
         self.cameras = []
+        self.still_configs = []  # Configuration each camera switches to for a capture
         self.active_camera = 0  # Index of the currently selected camera
         self.preview_active = True
         self.exposure_values = [0, 0]  # Exposure compensation for each camera
@@ -19,28 +48,55 @@ class DualCameraController:
             (2592, 1944)   # High resolution
         ]
         self.current_resolution_idx = 0  # Start with HD resolution
+        # The preview always uses the small lores stream; the resolution
+        # options above only affect still captures from the main stream
+        self.preview_size = (640, 480)
+        self._canvas = None  # Combined BGR preview buffer being filled this frame
+        self._slices = None  # Per-camera views into self._canvas
+        # The canvas pool holds (canvas, slices) pairs so the views are built once
+        self._free_canvases = queue.Queue()  # Canvases the display thread is done with
+        self._display_queue = queue.Queue(maxsize=1)  # Latest canvas waiting to be shown
+        self._key_queue = queue.Queue()  # Key presses read by the display thread
+        self._display_stop = threading.Event()
+        self._capture_pool = ThreadPoolExecutor(max_workers=2)  # Waits on both cameras at once
+        self._overlay_cache = {}  # camera index -> (overlay key, text lines, rendered text patch)
+        self._timestamp_sec = 0  # Second the cached overlay timestamp was formatted for
+        self._timestamp_str = ""
         self.save_directory = "camera_captures"
+        self._save_prefix = os.path.join(self.save_directory, "camera")  # Joined once, not per capture
+        # Encoded images are written to disk on a background thread
+        self._writer_queue = queue.Queue()
+        self._turbo_jpeg = None  # libjpeg-turbo encoder, if PyTurboJPEG is usable
+        if TurboJPEG is not None:
+            try:
+                self._turbo_jpeg = TurboJPEG()
+            except (OSError, RuntimeError) as e:
+                print(f"TurboJPEG unavailable, using Picamera2's JPEG encoder: {e}")
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
         self.setup_cameras()
         
     def setup_cameras(self):
         """Initialize and configure both cameras"""
         try:
             # Ensure the directory for saving images exists
-            if not os.path.exists(self.save_directory):
-                os.makedirs(self.save_directory)
+            os.makedirs(self.save_directory, exist_ok=True)
                 
             # Initialize both cameras
             for i in range(2):
                 camera = Picamera2(i)
-                # Configure camera with initial settings
-                config = camera.create_preview_configuration(
-                    main={"size": self.resolution_options[self.current_resolution_idx]},
-                    lores={"size": (640, 480)},
+                # Configure camera with initial settings. The lores stream is
+                # YUV420, half the bytes of RGB, and is converted to BGR once
+                # per frame
+                preview_config = camera.create_preview_configuration(
+                    main={"size": self.preview_size},
+                    lores={"size": self.preview_size, "format": "YUV420"},
                     display="lores"
                 )
-                camera.configure(config)
+                camera.configure(preview_config)
                 camera.start()
                 self.cameras.append(camera)
+                self.still_configs.append(self._create_still_config(camera))
                 
             print("Both cameras initialized successfully")
             
@@ -51,35 +107,78 @@ class DualCameraController:
     def capture_image(self, camera_idx):
         """Capture and save an image from the specified camera"""
         timestamp = time.strftime("%Y%m%d_%H%M%S")
-        filename = f"{self.save_directory}/camera{camera_idx+1}_{timestamp}.jpg"
+        filename = f"{self._save_prefix}{camera_idx+1}_{timestamp}.jpg"
         
-        # Capture image with current settings
-        img = self.cameras[camera_idx].capture_array()
+        # Switch to the still configuration just for this capture, carrying
+        # over the ISP controls, which a mode switch does not preserve
+        camera = self.cameras[camera_idx]
+        controls = self._camera_controls(camera_idx)
+        still_config = self.still_configs[camera_idx]
+        still_config["controls"].update(controls)
         
-        # Apply brightness adjustment if needed
-        if self.brightness_values[camera_idx] != 0:
-            img = cv2.convertScaleAbs(img, alpha=1, beta=self.brightness_values[camera_idx])
-            
-        # Save the image
-        cv2.imwrite(filename, img)
-        print(f"Image saved as {filename}")
+        # Brightness and exposure are applied in the ISP, so the main stream
+        # is encoded as captured
+        if self._turbo_jpeg is not None:
+            # Queue the captured array; the writer thread encodes it, so the
+            # preview loop resumes straight after the capture. Files encoded
+            # this way carry no EXIF metadata.
+            data = camera.switch_mode_and_capture_array(still_config, "main")
+        else:
+            buf = io.BytesIO()
+            camera.switch_mode_and_capture_file(still_config, buf, name="main", format="jpeg")
+            data = buf.getvalue()
+        camera.set_controls(controls)
+        
+        # Queue the image, so encoding and disk latency do not stall the preview
+        self._writer_queue.put((filename, data))
         return filename
     
+    def _writer_loop(self):
+        """Encode and write queued images until a None sentinel is received"""
+        while True:
+            item = self._writer_queue.get()
+            if item is None:
+                break
+            filename, data = item
+            
+            # Raw arrays come from the TurboJPEG path; the still stream is
+            # stored as [R, G, B], which TurboJPEG takes directly
+            if isinstance(data, np.ndarray):
+                try:
+                    data = self._turbo_jpeg.encode(data, quality=90, pixel_format=TJPF_RGB)
+                except Exception as e:
+                    print(f"Error encoding {filename}: {e}")
+                    continue
+            
+            try:
+                with open(filename, "wb") as f:
+                    f.write(data)
+                print(f"Image saved as {filename}")
+            except OSError as e:
+                print(f"Error saving {filename}: {e}")
+    
+    def _create_still_config(self, camera):
+        """Create a still configuration at the current capture resolution"""
+        return camera.create_still_configuration(
+            main={"size": self.resolution_options[self.current_resolution_idx]}
+        )
+    
+    def _camera_controls(self, camera_idx):
+        """Return the ISP controls matching the current settings of a camera"""
+        return {
+            "ExposureValue": self.exposure_values[camera_idx],
+            # libcamera expects brightness as -1.0 to 1.0
+            "Brightness": self.brightness_values[camera_idx] / 100.0
+        }
+    
     def change_resolution(self):
-        """Change resolution for both cameras"""
+        """Change the still capture resolution for both cameras"""
         self.current_resolution_idx = (self.current_resolution_idx + 1) % len(self.resolution_options)
         resolution = self.resolution_options[self.current_resolution_idx]
         
-        # Reconfigure both cameras with new resolution
-        for i, camera in enumerate(self.cameras):
-            camera.stop()
-            config = camera.create_preview_configuration(
-                main={"size": resolution},
-                lores={"size": (640, 480)},
-                display="lores"
-            )
-            camera.configure(config)
-            camera.start()
+        # Only the cached still configurations change; the cameras keep
+        # streaming their preview configuration untouched
+        self.still_configs = [self._create_still_config(camera) for camera in self.cameras]
             
         print(f"Resolution changed to {resolution[0]}x{resolution[1]}")
     
@@ -103,75 +202,151 @@ class DualCameraController:
         else:
             self.brightness_values[camera_idx] = max(-100, self.brightness_values[camera_idx] - step)
             
+        # Apply brightness in the ISP; libcamera expects -1.0 to 1.0
+        self.cameras[camera_idx].set_controls({"Brightness": self.brightness_values[camera_idx] / 100.0})
         print(f"Camera {camera_idx+1} brightness: {self.brightness_values[camera_idx]}")
     
     def add_info_overlay(self, frame, camera_idx):
         """Add information overlay to the frame"""
-        height, width = frame.shape[:2]
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        resolution = f"{width}x{height}"
+        # Only reformat the timestamp when the second rolls over
+        now = int(time.time())
+        if now != self._timestamp_sec:
+            self._timestamp_sec = now
+            self._timestamp_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
         
-        # Define the information to display
-        info_text = [
-            f"Camera {camera_idx+1} {'(ACTIVE)' if camera_idx == self.active_camera else ''}",
-            f"Time: {timestamp}",
-            f"Resolution: {resolution}",
-            f"Exposure: {self.exposure_values[camera_idx]}",
-            f"Brightness: {self.brightness_values[camera_idx]}"
-        ]
+        is_active = camera_idx == self.active_camera
+        
+        # Only rebuild and re-render the text when something it shows has changed
+        key = (is_active, self._timestamp_sec, self.current_resolution_idx,
+               self.exposure_values[camera_idx], self.brightness_values[camera_idx])
+        cached = self._overlay_cache.get(camera_idx)
+        if cached is None:
+            # The patch covers the background box and the bottom of the last
+            # line, which extends below the box
+            cached = (None, [""] * 5, np.zeros((111, 291, 3), np.uint8))
+        if cached[0] != key:
+            # Show the still capture resolution, not the preview frame size
+            still_width, still_height = self.resolution_options[self.current_resolution_idx]
+            
+            # Define the information to display
+            info_text = [
+                f"Camera {camera_idx+1} {'(ACTIVE)' if is_active else ''}",
+                f"Time: {self._timestamp_str}",
+                f"Resolution: {still_width}x{still_height}",
+                f"Exposure: {self.exposure_values[camera_idx]}",
+                f"Brightness: {self.brightness_values[camera_idx]}"
+            ]
+            
+            # Each line owns a 20 pixel band of the patch; clear and redraw only
+            # the lines whose text changed, usually just the timestamp
+            patch = cached[2]
+            for i, text in enumerate(info_text):
+                if text != cached[1][i]:
+                    patch[10 + i*20:30 + i*20] = 0
+                    cv2.putText(patch, text, (10, 25 + i*20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            cached = (key, info_text, patch)
+            self._overlay_cache[camera_idx] = cached
         
-        # Add a semi-transparent black background for text
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (10, 10), (300, 110), (0, 0, 0), -1)
-        cv2.addWeighted(overlay, 0.5, frame, 0.5, 0, frame)
+        # Add a semi-transparent black background for text by halving
+        # the pixels behind it in place
+        roi = frame[10:111, 10:301]
+        roi //= 2
         
-        # Add text
-        for i, text in enumerate(info_text):
-            cv2.putText(frame, text, (20, 35 + i*20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        # Stamp the cached text; its pixels are pure white, so OR-ing is exact
+        text_roi = frame[10:121, 10:301]
+        np.bitwise_or(text_roi, cached[2], out=text_roi)
             
         # Highlight active camera with a colored border
-        if camera_idx == self.active_camera:
-            cv2.rectangle(frame, (0, 0), (width-1, height-1), (0, 255, 0), 2)
+        if is_active:
+            # A 2 pixel border is just four slice assignments
+            frame[:2] = self._BORDER_COLOR
+            frame[-2:] = self._BORDER_COLOR
+            frame[:, :2] = self._BORDER_COLOR
+            frame[:, -2:] = self._BORDER_COLOR
             
         return frame
     
+    def _next_canvas(self):
+        """Return a free (canvas, slices) pair, allocating a new one if none is available"""
+        width, height = self.preview_size
+        shape = (height, width * len(self.cameras), 3)
+        try:
+            canvas, slices = self._free_canvases.get_nowait()
+        except queue.Empty:
+            canvas = None
+        if canvas is None or canvas.shape != shape:
+            canvas = np.empty(shape, np.uint8)
+            slices = [canvas[:, i*width:(i+1)*width] for i in range(len(self.cameras))]
+        return canvas, slices
+    
+    def _show_canvas(self, canvas, slices):
+        """Hand a canvas to the display thread, dropping any frame it has not shown yet"""
+        try:
+            self._free_canvases.put(self._display_queue.get_nowait())
+        except queue.Empty:
+            pass
+        self._display_queue.put((canvas, slices))
+    
+    def _process_into(self, dst, frame, camera_idx):
+        """Convert a preview frame into its canvas slice and draw the overlay there"""
+        # Convert the YUV420 lores frame straight into the BGR canvas slice
+        cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420, dst=dst)
+        self.add_info_overlay(dst, camera_idx)
+    
+    def _poll_key(self):
+        """Pump GUI events and return any key press without sleeping"""
+        # cv2.pollKey is only available from OpenCV 4.5; waitKey(1) always sleeps
+        if hasattr(cv2, "pollKey"):
+            return cv2.pollKey()
+        return cv2.waitKey(1)
+    
+    def _display_loop(self):
+        """Show preview frames and read key presses off the capture thread"""
+        while not self._display_stop.is_set():
+            try:
+                item = self._display_queue.get(timeout=0.05)
+            except queue.Empty:
+                item = None
+            
+            if item is not None:
+                # imshow copies the pixels, so the canvas can be reused right away
+                cv2.imshow('Dual Camera Preview', item[0])
+                self._free_canvases.put(item)
+            
+            key = self._poll_key() & 0xFF
+            if key != 0xFF:
+                self._key_queue.put(key)
+        
+        cv2.destroyAllWindows()
+    
     def run(self):
         """Main function to run the dual camera preview and control"""
-        print("\nDual Camera Controller Started")
-        print("--------------------------------")
-        print("Controls:")
-        print("  1, 2      - Select Camera 1 or 2")
-        print("  s         - Save image from active camera")
-        print("  d         - Save images from both cameras")
-        print("  r         - Change resolution")
-        print("  e/c       - Increase/decrease exposure of active camera")
-        print("  b/v       - Increase/decrease brightness of active camera")
-        print("  p         - Pause/resume preview")
-        print("  q         - Quit application")
-        print("--------------------------------")
+        print(CONTROLS_HELP)
+        
+        # Showing frames and pumping GUI events happens on its own thread
+        display_thread = threading.Thread(target=self._display_loop, daemon=True)
+        display_thread.start()
         
         while True:
-            # Capture frames from both cameras
-            frames = []
-            for i, camera in enumerate(self.cameras):
-                frame = camera.capture_array()
+            # Capture and composite frames only while the preview is shown;
+            # capture_image grabs its own frame, so nothing is needed when paused
+            if self.preview_active:
+                # Reuse a side-by-side canvas the display thread has finished with
+                self._canvas, self._slices = self._next_canvas()
                 
-                # Apply brightness adjustment
-                if self.brightness_values[i] != 0:
-                    frame = cv2.convertScaleAbs(frame, alpha=1, beta=self.brightness_values[i])
+                # Capture preview frames from the lores stream of both cameras
+                # concurrently, so waiting on one does not delay the other
+                futures = [self._capture_pool.submit(camera.capture_array, "lores") for camera in self.cameras]
+                for i, future in enumerate(futures):
+                    self._process_into(self._slices[i], future.result(), i)
                 
-                # Add information overlay
-                frame = self.add_info_overlay(frame, i)
-                frames.append(frame)
-            
-            # Display frames if preview is active
-            if self.preview_active:
-                 # Stack the frames horizontally
-                 combined_frame = np.hstack([cv2.cvtColor(f, cv2.COLOR_RGB2BGR) for f in frames])
-                 cv2.imshow('Dual Camera Preview', combined_frame)
+                self._show_canvas(self._canvas, self._slices)
             
-            # Handle keyboard input
-            key = cv2.waitKey(1) & 0xFF
+            # Handle keyboard input; when paused, idle here until a key arrives
+            try:
+                key = self._key_queue.get(block=not self.preview_active, timeout=0.05)
+            except queue.Empty:
+                key = 0xFF
             
             if key == ord('q'):
                 # Quit the application
@@ -225,7 +400,12 @@ class DualCameraController:
                     print("Preview paused")
         
         # Clean up
-        cv2.destroyAllWindows()
+        self._display_stop.set()
+        display_thread.join()
+        self._capture_pool.shutdown()
+        # Finish writing any images still queued
+        self._writer_queue.put(None)
+        self._writer_thread.join()
         for camera in self.cameras:
             camera.stop()
         print("Application terminated")